@@ -1,114 +1,26 @@
 # app.py — Streamlit Cloud ready
 # Template selector (with previews) • Custom upload
-# Robust PPTX replacement (split runs/tables/groups)
+# Robust PPTX replacement (split runs/tables/groups) — see pptx_tokens.py
 # Session History with thumbnails • Export ZIP • Restore
 
-import re
 import io
 import os
 import base64
+import hashlib
+import posixpath
 import zipfile
+from collections import deque
 from pathlib import Path
 from datetime import date, datetime
 from io import BytesIO
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 
 import streamlit as st
-from pptx import Presentation
-from pptx.shapes.group import GroupShape
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
 
-# ==============================
-# Formatting helpers
-# ==============================
-MESES_ES = [
-    "enero","febrero","marzo","abril","mayo","junio",
-    "julio","agosto","septiembre","octubre","noviembre","diciembre",
-]
-def fecha_es(d: date) -> str:
-    return f"{d.day} de {MESES_ES[d.month-1]} de {d.year}"
-
-def format_ars_dots(value) -> str:
-    digits = "".join(ch for ch in str(value) if ch.isdigit())
-    if not digits:
-        return str(value)
-    return f"{int(digits):,}".replace(",", ".")
-
-# ==============================
-# Placeholder patterns
-# ==============================
-PLACEHOLDER = re.compile(r"{{\s*([A-Z0-9_]+)\s*}}")
-PAT_NAME = re.compile(r"\{X{6}\}")            # {XXXXXX}
-PAT_POS  = re.compile(r"(?<!\{)X{8}(?!\})")   # XXXXXXXX (not inside {})
-PAT_DATE = re.compile(r"\bX{2}\s+de\s+X{4,5}\s+de\s+\d{4}\b")
-PAT_SAL  = re.compile(r"\bX\.XXX\.XXX\b")
-
-def apply_x_style(text: str, mapping: dict) -> str:
-    name = mapping.get("CANDIDATE_NAME")
-    position = mapping.get("POSITION")
-    join_date_es = mapping.get("JOIN_DATE")
-    salary = mapping.get("SALARY")
-    city = mapping.get("CITY", "Buenos Aires")
-    offer_date_es = mapping.get("DATE")
-
-    out = text
-    if name:     out = PAT_NAME.sub(name, out)
-    if position: out = PAT_POS.sub(position, out)
-    if join_date_es: out = PAT_DATE.sub(join_date_es, out)
-    if salary:   out = PAT_SAL.sub(format_ars_dots(salary), out)
-
-    striped = out.strip()
-    if striped == ", Buenos Aires" or striped.endswith(", Buenos Aires"):
-        out = f"{offer_date_es}, {city}" if offer_date_es else city
-    return out
-
-def replace_placeholders_in_text(text: str, mapping: dict) -> str:
-    def repl(m):
-        key = m.group(1).upper()
-        return str(mapping.get(key, m.group(0)))
-    return apply_x_style(PLACEHOLDER.sub(repl, text), mapping)
-
-# ==============================
-# PPTX text replacement (runs/tables/groups safe)
-# ==============================
-def _replace_in_text_frame(tf, mapping: dict):
-    for para in tf.paragraphs:
-        if not para.runs:
-            if para.text:
-                new = replace_placeholders_in_text(para.text, mapping)
-                if new != para.text:
-                    para.text = new
-            continue
-        full = "".join(run.text for run in para.runs)
-        new = replace_placeholders_in_text(full, mapping)
-        if new == full:
-            continue
-        para.runs[0].text = new
-        for r in para.runs[1:]:
-            r.text = ""
-
-def _replace_in_table(tbl, mapping: dict):
-    for r in tbl.rows:
-        for c in r.cells:
-            if c.text_frame:
-                _replace_in_text_frame(c.text_frame, mapping)
-
-def _walk_shapes(shapes, mapping: dict):
-    for shape in shapes:
-        if getattr(shape, "has_text_frame", False) and shape.text_frame:
-            _replace_in_text_frame(shape.text_frame, mapping)
-        if getattr(shape, "has_table", False):
-            _replace_in_table(shape.table, mapping)
-        if isinstance(shape, GroupShape):
-            _walk_shapes(shape.shapes, mapping)
-
-def render_pptx(pptx_bytes: bytes, mapping: dict) -> BytesIO:
-    prs = Presentation(BytesIO(pptx_bytes))
-    for slide in prs.slides:
-        _walk_shapes(slide.shapes, mapping)
-    out = BytesIO()
-    prs.save(out)
-    out.seek(0)
-    return out
+from pptx_tokens import fecha_es, format_ars_dots, render_pptx
 
 # ==============================
 # Template loader & thumbnail utils
@@ -119,21 +31,43 @@ def list_templates() -> List[Path]:
         return []
     return sorted([p for p in tpl_dir.glob("*.pptx") if p.is_file()])
 
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _read_template(path_str: str, mtime: float) -> bytes:
+    """File contents, re-read only when mtime changes (bytes are immutable, safe to share)."""
+    return Path(path_str).read_bytes()
+
+def template_bytes(p: Path) -> bytes:
+    return _read_template(str(p), p.stat().st_mtime)
+
 def load_template_bytes(label: str) -> Optional[bytes]:
     for p in list_templates():
         if p.stem.replace("_", " ") == label:
-            return p.read_bytes()
+            return template_bytes(p)
     return None
 
-def pptx_doc_thumbnail(pptx_bytes: bytes) -> Optional[Tuple[str, bytes]]:
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _render_cached(pptx_hash: bytes, mapping_items: Tuple[Tuple[str, str], ...], _pptx_bytes: bytes) -> bytes:
+    return render_pptx(_pptx_bytes, dict(mapping_items))
+
+def render_offer(pptx_bytes: bytes, mapping: dict) -> bytes:
+    """
+    render_pptx memoized per (template digest, mapping): Generate with unchanged inputs returns
+    the same bytes object (history then shares it). The bytes are skipped by Streamlit's hasher.
+    """
+    pptx_hash = hashlib.blake2b(pptx_bytes, digest_size=16).digest()
+    return _render_cached(pptx_hash, tuple(sorted(mapping.items())), pptx_bytes)
+
+def pptx_doc_thumbnail(pptx: Union[bytes, Path]) -> Optional[Tuple[str, bytes]]:
     """
     Extract document preview thumbnail from /docProps/thumbnail.jpeg|jpg|png if present.
+    Accepts the pptx bytes or a path; a path lets zipfile read just that member from disk.
     Returns (mime, data) or None.
     """
     try:
-        with zipfile.ZipFile(BytesIO(pptx_bytes)) as zf:
+        with zipfile.ZipFile(BytesIO(pptx) if isinstance(pptx, bytes) else pptx) as zf:
+            names = set(zf.namelist())
             for name in ("docProps/thumbnail.jpeg", "docProps/thumbnail.jpg", "docProps/thumbnail.png"):
-                if name in zf.namelist():
+                if name in names:
                     data = zf.read(name)
                     mime = "image/jpeg" if name.endswith(("jpeg", "jpg")) else "image/png"
                     return mime, data
@@ -167,17 +101,41 @@ def embed_svg(svg_bytes: bytes, width: int = 240):
     b64 = base64.b64encode(svg_bytes).decode("utf-8")
     st.markdown(f"<img src='data:image/svg+xml;base64,{b64}' width='{width}' />", unsafe_allow_html=True)
 
+def _rels_targets(zf: zipfile.ZipFile, part: str) -> dict:
+    """rId -> (relationship type, zip member name) for a package part ("" = package root)."""
+    base, name = posixpath.split(part)
+    rels = parse_xml(zf.read(posixpath.join(base, "_rels", f"{name}.rels")))
+    targets = {}
+    for r in rels:
+        if r.get("TargetMode") == "External":
+            continue
+        target = r.get("Target")
+        member = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(base, target))
+        targets[r.get("Id")] = (r.get("Type"), member)
+    return targets
+
+@st.cache_data(max_entries=16, show_spinner=False)
 def first_texts_from_pptx(pptx_bytes: bytes, max_len: int = 40) -> Tuple[str, str]:
-    """Best-effort: pull first two meaningful text lines from first slide."""
+    """
+    Best-effort: pull first two meaningful text lines from first slide (cached by content).
+    Reads only the first slide's XML from the zip instead of loading the whole Presentation.
+    """
     try:
-        prs = Presentation(BytesIO(pptx_bytes))
-        if not prs.slides:
-            return "", ""
+        with zipfile.ZipFile(BytesIO(pptx_bytes)) as zf:
+            prs_part = next(m for t, m in _rels_targets(zf, "").values() if t == RT.OFFICE_DOCUMENT)
+            sld_id = parse_xml(zf.read(prs_part)).find(f"{qn('p:sldIdLst')}/{qn('p:sldId')}")
+            if sld_id is None:
+                return "", ""
+            _, slide_part = _rels_targets(zf, prs_part)[sld_id.get(qn("r:id"))]
+            slide = parse_xml(zf.read(slide_part))
         texts = []
-        for shp in prs.slides[0].shapes:
-            if getattr(shp, "has_text_frame", False):
-                for p in shp.text_frame.paragraphs:
-                    s = "".join(r.text for r in p.runs) if p.runs else (p.text or "")
+        # Top-level text shapes only, in z-order, like slide.shapes + has_text_frame
+        for sp in slide.find(qn("p:cSld")).find(qn("p:spTree")).iterchildren(qn("p:sp")):
+            tx_body = sp.find(qn("p:txBody"))
+            if tx_body is not None:
+                for p in tx_body.iterchildren(qn("a:p")):
+                    runs = p.r_lst
+                    s = "".join(r.text for r in runs) if runs else (p.text or "")
                     s = " ".join(s.split())
                     if s:
                         texts.append(s)
@@ -189,35 +147,62 @@ def first_texts_from_pptx(pptx_bytes: bytes, max_len: int = 40) -> Tuple[str, st
     except Exception:
         return "Offer Template", ""
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def _template_preview(path_str: str, mtime: float) -> Tuple[Optional[Tuple[str, bytes]], Tuple[str, str]]:
+    thumb = pptx_doc_thumbnail(Path(path_str))
+    if thumb:
+        return thumb, ("", "")
+    return None, first_texts_from_pptx(_read_template(path_str, mtime))
+
+def template_preview(p: Path) -> Tuple[Optional[Tuple[str, bytes]], Tuple[str, str]]:
+    """Gallery preview (doc thumbnail, else first texts) keyed by (path, mtime): no hashing of file bytes per rerun."""
+    return _template_preview(str(p), p.stat().st_mtime)
+
 # ==============================
 # Session History
 # ==============================
 HISTORY_KEY = "offer_history"
+HISTORY_ZIP_KEY = "offer_history_zip"
 MAX_HISTORY = 50
 
 def ensure_history():
     if HISTORY_KEY not in st.session_state:
-        st.session_state[HISTORY_KEY] = []
+        # Bounded: append evicts the oldest entry once MAX_HISTORY is reached
+        st.session_state[HISTORY_KEY] = deque(maxlen=MAX_HISTORY)
 
 def push_history(entry: dict):
     ensure_history()
-    st.session_state[HISTORY_KEY].append(entry)
-    if len(st.session_state[HISTORY_KEY]) > MAX_HISTORY:
-        st.session_state[HISTORY_KEY] = st.session_state[HISTORY_KEY][-MAX_HISTORY:]
+    history = st.session_state[HISTORY_KEY]
+    # Renders are deterministic: identical offers share one bytes object instead of another copy
+    entry["pptx_hash"] = hashlib.blake2b(entry["pptx_bytes"], digest_size=16).digest()
+    for other in history:
+        if other.get("pptx_hash") == entry["pptx_hash"]:
+            entry["pptx_bytes"] = other["pptx_bytes"]
+            break
+    history.append(entry)
 
 def delete_history(idx: int):
     ensure_history()
     if 0 <= idx < len(st.session_state[HISTORY_KEY]):
-        st.session_state[HISTORY_KEY].pop(idx)
+        del st.session_state[HISTORY_KEY][idx]
+        # Free the cached export now: once history is empty nothing would rebuild (or replace) it
+        st.session_state.pop(HISTORY_ZIP_KEY, None)
 
 def zip_all_history() -> bytes:
+    """Export ZIP, rebuilt only when the history changes (the button renders on every rerun)."""
     ensure_history()
+    sig = tuple((item["ts"], item["file_name"]) for item in st.session_state[HISTORY_KEY])
+    cached = st.session_state.get(HISTORY_ZIP_KEY)
+    if cached and cached[0] == sig:
+        return cached[1]
     mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
+    with zipfile.ZipFile(mem, "w", zipfile.ZIP_STORED) as zf:
+        # Members are .pptx files, already deflated: storing them costs no size
         for item in st.session_state[HISTORY_KEY]:
             zf.writestr(item["file_name"], item["pptx_bytes"])
-    mem.seek(0)
-    return mem.getvalue()
+    data = mem.getvalue()
+    st.session_state[HISTORY_ZIP_KEY] = (sig, data)
+    return data
 
 # ==============================
 # UI
@@ -253,14 +238,12 @@ if templates:
     cols = st.columns(3)
     for i, p in enumerate(templates):
         with cols[i % 3]:
-            pptx_bytes = p.read_bytes()
-            thumb = pptx_doc_thumbnail(pptx_bytes)
+            thumb, (t1, t2) = template_preview(p)
             if thumb:
                 mime, data = thumb
                 # Use new parameter name to avoid deprecation warning
                 st.image(data, caption=p.stem.replace("_", " "), use_container_width=True)
             else:
-                t1, t2 = first_texts_from_pptx(pptx_bytes)
                 embed_svg(svg_placeholder(t1, t2), width=300)
                 st.caption(p.stem.replace("_", " "))
 
@@ -292,7 +275,7 @@ with col1:
     )
 with col2:
     if st.button("Clear fields"):
-        st.experimental_rerun()
+        st.rerun()
 
 # --- Generate ---
 if generate_clicked:
@@ -301,7 +284,8 @@ if generate_clicked:
         source_bytes = builtin_template_bytes
         template_label = pick
     elif uploaded_file:
-        source_bytes = uploaded_file.read()
+        # UploadedFile is a BytesIO over the upload: getvalue() shares it, no copy/seek needed
+        source_bytes = uploaded_file.getvalue()
         template_label = uploaded_file.name
     else:
         st.warning("Please select a built-in template or upload a PPTX.")
@@ -327,13 +311,13 @@ if generate_clicked:
             extra_pairs.append((k.upper(), v))
 
     try:
-        edited = render_pptx(source_bytes, mapping)
+        pptx_out = render_offer(source_bytes, mapping)
         safe_name = " ".join(full_name.split()) or "Offer Letter"
         file_name_out = f"Offer Letter - {safe_name}.pptx"
 
         st.download_button(
             "Download Updated PPTX",
-            data=edited.getvalue(),
+            data=pptx_out,
             file_name=file_name_out,
             mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
         )
@@ -351,7 +335,7 @@ if generate_clicked:
         push_history({
             "ts": datetime.now(),
             "file_name": file_name_out,
-            "pptx_bytes": edited.getvalue(),
+            "pptx_bytes": pptx_out,
             "thumb_mime": t_mime,
             "thumb_bytes": t_bytes,
             "template": template_label,
@@ -370,69 +354,77 @@ st.divider()
 # ==============================
 # History with thumbnails
 # ==============================
-ensure_history()
-st.subheader(f"History (this session) — {len(st.session_state[HISTORY_KEY])} item(s)")
-
-if st.session_state[HISTORY_KEY]:
-    st.download_button(
-        "Export all offers (ZIP)",
-        data=zip_all_history(),
-        file_name="offer_letters_history.zip",
-        mime="application/zip",
-        type="secondary",
-    )
+# Fragment: the panel's own buttons (downloads) rerun only the panel; any other
+# interaction, including the form above, still reruns the whole script with it
+@st.fragment
+def history_panel():
+    ensure_history()
+    st.subheader(f"History (this session) — {len(st.session_state[HISTORY_KEY])} item(s)")
 
-    # Cards newest-first
-    for idx, item in reversed(list(enumerate(st.session_state[HISTORY_KEY]))):
-        meta = item["fields"]
-        ts = item["ts"].strftime("%Y-%m-%d %H:%M")
-
-        cthumb, cmeta = st.columns([1, 3])
-        with cthumb:
-            if item["thumb_mime"] == "image/svg+xml":
-                embed_svg(item["thumb_bytes"], width=220)
-            elif item["thumb_mime"] in ("image/png", "image/jpeg"):
-                st.image(item["thumb_bytes"], use_container_width=True)
-            else:
-                embed_svg(svg_placeholder("Offer Letter", f"{meta['first_name']} {meta['last_name']}"), width=220)
-
-        with cmeta:
-            st.markdown(
-                f"**{item['file_name']}**  \n"
-                f"**{meta['first_name']} {meta['last_name']}** — {meta['position']}  \n"
-                f"{meta['city']} · Offer: {fecha_es(date.fromisoformat(meta['offer_date']))} · "
-                f"Join: {fecha_es(date.fromisoformat(meta['join_date']))}  \n"
-                f"Salary: {format_ars_dots(meta['salary_num'])}  \n"
-                f"Template: {item.get('template','N/A')}  \n"
-                f"*Created:* {ts}"
-            )
-
-            bcol1, bcol2, bcol3 = st.columns([1,1,1])
-            with bcol1:
-                st.download_button(
-                    "Download again",
-                    data=item["pptx_bytes"],
-                    file_name=item["file_name"],
-                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                    key=f"dl_{idx}",
+    if st.session_state[HISTORY_KEY]:
+        st.download_button(
+            "Export all offers (ZIP)",
+            data=zip_all_history(),
+            file_name="offer_letters_history.zip",
+            mime="application/zip",
+            type="secondary",
+        )
+
+        # Cards newest-first (index walk: no copy of the history per rerun)
+        history = st.session_state[HISTORY_KEY]
+        for idx in range(len(history) - 1, -1, -1):
+            item = history[idx]
+            meta = item["fields"]
+            ts = item["ts"].strftime("%Y-%m-%d %H:%M")
+
+            cthumb, cmeta = st.columns([1, 3])
+            with cthumb:
+                if item["thumb_mime"] == "image/svg+xml":
+                    embed_svg(item["thumb_bytes"], width=220)
+                elif item["thumb_mime"] in ("image/png", "image/jpeg"):
+                    st.image(item["thumb_bytes"], use_container_width=True)
+                else:
+                    embed_svg(svg_placeholder("Offer Letter", f"{meta['first_name']} {meta['last_name']}"), width=220)
+
+            with cmeta:
+                st.markdown(
+                    f"**{item['file_name']}**  \n"
+                    f"**{meta['first_name']} {meta['last_name']}** — {meta['position']}  \n"
+                    f"{meta['city']} · Offer: {fecha_es(date.fromisoformat(meta['offer_date']))} · "
+                    f"Join: {fecha_es(date.fromisoformat(meta['join_date']))}  \n"
+                    f"Salary: {format_ars_dots(meta['salary_num'])}  \n"
+                    f"Template: {item.get('template','N/A')}  \n"
+                    f"*Created:* {ts}"
                 )
-            with bcol2:
-                if st.button("Restore to form", key=f"restore_{idx}"):
-                    st.session_state["First name"] = meta["first_name"]
-                    st.session_state["Last name"]  = meta["last_name"]
-                    st.session_state["Position"]   = meta["position"]
-                    st.session_state["Salary (ARS)"] = meta["salary_num"]
-                    st.session_state["Offer date"] = date.fromisoformat(meta["offer_date"])
-                    st.session_state["Join date"]  = date.fromisoformat(meta["join_date"])
-                    st.session_state["City"]       = meta["city"]
-                    st.session_state["_extras_prefill"] = [{"key": k, "value": v} for k, v in item["extras"]]
-                    st.experimental_rerun()
-            with bcol3:
-                if st.button("Delete", key=f"del_{idx}"):
-                    delete_history(idx)
-                    st.experimental_rerun()
-else:
-    st.info("No offers generated yet. When you create one, it will appear here with a thumbnail.")
+
+                bcol1, bcol2, bcol3 = st.columns([1,1,1])
+                with bcol1:
+                    st.download_button(
+                        "Download again",
+                        data=item["pptx_bytes"],
+                        file_name=item["file_name"],
+                        mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                        key=f"dl_{idx}",
+                    )
+                with bcol2:
+                    if st.button("Restore to form", key=f"restore_{idx}"):
+                        st.session_state["First name"] = meta["first_name"]
+                        st.session_state["Last name"]  = meta["last_name"]
+                        st.session_state["Position"]   = meta["position"]
+                        st.session_state["Salary (ARS)"] = meta["salary_num"]
+                        st.session_state["Offer date"] = date.fromisoformat(meta["offer_date"])
+                        st.session_state["Join date"]  = date.fromisoformat(meta["join_date"])
+                        st.session_state["City"]       = meta["city"]
+                        st.session_state["_extras_prefill"] = [{"key": k, "value": v} for k, v in item["extras"]]
+                        st.rerun()
+                with bcol3:
+                    if st.button("Delete", key=f"del_{idx}"):
+                        delete_history(idx)
+                        st.rerun()
+    else:
+        st.info("No offers generated yet. When you create one, it will appear here with a thumbnail.")
+
+history_panel()
 
 # Consume extras prefill on restore (cannot live-update the editor mid-run)
 if "_extras_prefill" in st.session_state:
@@ -445,12 +437,11 @@ def footer_logo():
     for name in ("hogarth_split_black.png", "hogarth_split.png"):
         p = Path(__file__).with_name(name)
         if p.exists():
-            b64 = base64.b64encode(p.read_bytes()).decode("utf-8")
-            st.markdown(
-                f"<div style='display:flex;justify-content:center;margin-top:36px'>"
-                f"<img src='data:image/png;base64,{b64}' style='max-width:520px;width:60%;height:auto' />"
-                f"</div>",
-                unsafe_allow_html=True,
-            )
+            # st.image serves the file from Streamlit's media endpoint: no base64 payload per rerun.
+            # Same box as before: 36px gap, centred, 60% wide (middle column) capped at 520px
+            st.markdown("<div style='height:36px'></div>", unsafe_allow_html=True)
+            _, mid, _ = st.columns([1, 3, 1])
+            with mid:
+                st.image(str(p), width=520)
             break
 footer_logo()
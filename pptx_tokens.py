@@ -0,0 +1,215 @@
+# pptx_tokens.py — placeholder engine for the offer letter app
+# {{KEY}} placeholders + legacy X-style tokens ({XXXXXX}, XXXXXXXX, dates, salary)
+# Split-run safe replacement on the slide XML (shapes/tables/groups)
+# No Streamlit imports: app.py owns caching and UI
+
+import re
+from datetime import date
+from functools import lru_cache
+from io import BytesIO
+from typing import Callable, NamedTuple, Optional, Set
+from zipfile import ZipFile
+
+from pptx.opc.constants import CONTENT_TYPE as CT, NAMESPACE as NS
+from pptx.opc.oxml import serialize_part_xml
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+
+# ==============================
+# Formatting helpers
+# ==============================
+MESES_ES = (
+    "enero","febrero","marzo","abril","mayo","junio",
+    "julio","agosto","septiembre","octubre","noviembre","diciembre",
+)
+@lru_cache(maxsize=128)
+def fecha_es(d: date) -> str:
+    return f"{d.day} de {MESES_ES[d.month-1]} de {d.year}"
+
+_NON_DIGIT_SUB = re.compile(r"\D+").sub
+
+@lru_cache(maxsize=32)
+def format_ars_dots(value) -> str:
+    if type(value) is int and value >= 0:
+        # st.number_input hands over a plain int: no digit filtering needed
+        return f"{value:,}".replace(",", ".")
+    s = str(value)
+    digits = _NON_DIGIT_SUB("", s)
+    if not digits:
+        return s
+    return f"{int(digits):,}".replace(",", ".")
+
+# ==============================
+# Placeholder patterns
+# ==============================
+# Legacy X-style tokens. make_replacer() prepends a {{KEY}} alternative built from
+# the mapping's own keys, so each text is scanned once for every kind of token.
+X_STYLE = (
+    r"(?P<name>\{X{6}\})"                                     # {XXXXXX}
+    r"|(?P<pos>(?<!\{)X{8}(?!\}))"                            # XXXXXXXX (not inside {})
+    r"|(?P<date>\bX{2}\s+de\s+X{4,5}\s+de\s+\d{4}\b)"          # XX de XXXXX de 2025
+    r"|(?P<sal>\bX\.XXX\.XXX\b)"                               # X.XXX.XXX
+)
+PLACEHOLDER_KEY = re.compile(r"[A-Z0-9_]+", re.ASCII)
+
+def fused_pattern(keys) -> "re.Pattern[str]":
+    """{{KEY}} for the given keys (others never match) | the X-style tokens."""
+    keys = sorted(k for k in keys if PLACEHOLDER_KEY.fullmatch(k))
+    if not keys:
+        return re.compile(X_STYLE)
+    alts = "|".join(map(re.escape, keys))
+    return re.compile(r"(?P<curly>\{\{\s*(?P<key>" + alts + r")\s*\}\})|" + X_STYLE)
+
+CITY_TAIL = ", Buenos Aires"
+# Substrings at least one of which any replaceable paragraph must contain
+SENTINELS = ("{{", "XX", "Buenos Aires")
+
+def _has_sentinel(text: str) -> bool:
+    return any(s in text for s in SENTINELS)
+
+class SubstContext(NamedTuple):
+    """Mapping values the X-style tokens need, resolved once per render."""
+    name: Optional[str]
+    position: Optional[str]
+    join_date_es: Optional[str]
+    salary_fmt: Optional[str]
+    city: str
+    offer_date_es: Optional[str]
+
+def subst_context(mapping: dict) -> SubstContext:
+    salary = mapping.get("SALARY")
+    return SubstContext(
+        name=mapping.get("CANDIDATE_NAME"),
+        position=mapping.get("POSITION"),
+        join_date_es=mapping.get("JOIN_DATE"),
+        salary_fmt=format_ars_dots(salary) if salary else None,
+        city=mapping.get("CITY", "Buenos Aires"),
+        offer_date_es=mapping.get("DATE"),
+    )
+
+def make_replacer(mapping: dict) -> Callable[[str], str]:
+    """Bind mapping once per render; returns a memoized text -> replaced text."""
+    ctx = subst_context(mapping)
+    # Only keys present in mapping can match, so the callback needs no default branch
+    curly = {k: str(v) for k, v in mapping.items()}
+    pattern_sub = fused_pattern(mapping).sub
+    # lastgroup -> value; X-style tokens are left as-is when the value is empty
+    x_values = {"name": ctx.name, "pos": ctx.position, "date": ctx.join_date_es, "sal": ctx.salary_fmt}
+    city_line = f"{ctx.offer_date_es}, {ctx.city}" if ctx.offer_date_es else ctx.city
+
+    def repl(m):
+        group = m.lastgroup
+        if group == "curly":
+            return curly[m.group("key")]
+        return x_values[group] or m.group(0)
+
+    # Per-render memo: decks repeat labels/boilerplate, and the mapping is fixed for the render
+    @lru_cache(maxsize=4096)
+    def replace(text: str) -> str:
+        # Every token contains "{{" or "X": a C-level substring test skips the regex engine.
+        # "{{" is the rarer of the two, so test it first.
+        has_token = "{{" in text or "X" in text
+        if not has_token and CITY_TAIL not in text:
+            return text
+        out = pattern_sub(repl, text) if has_token else text
+        if CITY_TAIL in out and out.rstrip().endswith(CITY_TAIL):
+            out = city_line
+        return out
+
+    return replace
+
+# ==============================
+# PPTX text replacement (runs/tables/groups safe, on the slide XML)
+# ==============================
+_A_P = qn("a:p")
+
+def _replace_in_paragraph(p, replace: Callable[[str], str]) -> bool:
+    """p is a python-pptx CT_TextParagraph (<a:p>) element. Returns True if it was modified."""
+    runs = p.r_lst
+    if not runs:
+        # Fields / line breaks only: rewrite the whole paragraph if needed
+        text = p.text
+        if text and _has_sentinel(text):
+            new = replace(text)
+            if new != text:
+                for child in p.content_children:
+                    p.remove(child)
+                p.append_text(new)
+                return True
+        return False
+    if len(runs) == 1:
+        # Common case: single run, no join needed
+        run = runs[0]
+        t = run.text
+        if t and _has_sentinel(t):
+            new = replace(t)
+            if new != t:
+                run.text = new
+                return True
+        return False
+    # Tokens may be split across runs: replace on the joined text, keep first run's formatting
+    texts = [r.text for r in runs]
+    # Checked per run before building the joined string: a token or city tail, even when
+    # split across runs, always leaves a "{", an "X" or the "B" of "Buenos" in some run.
+    if not any("{" in t or "X" in t or "B" in t for t in texts):
+        return False
+    full = "".join(texts)
+    if not _has_sentinel(full):
+        return False
+    new = replace(full)
+    if new == full:
+        return False
+    # Prefer editing runs in place, which keeps per-run formatting (e.g. a bold salary). Only
+    # when a token spans runs, or depends on a neighbouring run, merge into the first run.
+    parts = [replace(t) for t in texts]
+    if "".join(parts) == new:
+        for r, t, part in zip(runs, texts, parts):
+            if part != t:
+                r.text = part
+        return True
+    runs[0].text = new
+    # Drop the emptied runs rather than leaving <a:r><a:t/></a:r> behind
+    for r in runs[1:]:
+        p.remove(r)
+    return True
+
+_CT_OVERRIDE = f"{{{NS.OPC_CONTENT_TYPES}}}Override"
+
+def _slide_part_names(zin: ZipFile) -> Set[str]:
+    """Zip member names of the slide parts, as declared in [Content_Types].xml."""
+    types = parse_xml(zin.read("[Content_Types].xml"))
+    return {
+        o.get("PartName").lstrip("/")
+        for o in types.iter(_CT_OVERRIDE)
+        if o.get("ContentType") == CT.PML_SLIDE
+    }
+
+def render_pptx(pptx_bytes: bytes, mapping: dict) -> bytes:
+    """
+    Render a template's bytes, working on the zip directly: only the slide parts are parsed
+    and run through _replace_in_paragraph, every other member is copied through with its
+    original compression. Skips building the whole python-pptx package and re-deflating
+    already-stored media on save. Returns pptx_bytes itself when nothing was substituted.
+    """
+    replace = make_replacer(mapping)
+    with ZipFile(BytesIO(pptx_bytes)) as zin:
+        # slide part name -> new XML, only for slides that actually changed
+        rendered = {}
+        for name in _slide_part_names(zin).intersection(zin.namelist()):
+            root = parse_xml(zin.read(name))
+            changed = False
+            for p in root.iter(_A_P):
+                changed |= _replace_in_paragraph(p, replace)
+            if changed:
+                rendered[name] = serialize_part_xml(root)
+        if not rendered:
+            # Nothing to substitute: the template itself is the result
+            return pptx_bytes
+        out = BytesIO()
+        with ZipFile(out, "w") as zout:
+            for item in zin.infolist():
+                data = rendered.get(item.filename)
+                if data is None:
+                    data = zin.read(item)
+                zout.writestr(item, data)  # ZipInfo carries the member's compress_type
+    return out.getvalue()
@@ -0,0 +1,89 @@
+# test_pptx_tokens.py — behaviour pins for the placeholder engine
+# Run with: python -m unittest
+
+import unittest
+import zipfile
+from io import BytesIO
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from pptx_tokens import render_pptx
+
+MAPPING = {
+    "CANDIDATE_NAME": "Ana Pérez",
+    "POSITION": "Data Engineer",
+    "SALARY": "2000000",
+    "JOIN_DATE": "1 de marzo de 2026",
+    "DATE": "14 de febrero de 2026",
+    "CITY": "Córdoba",
+}
+
+def make_deck(*paragraphs) -> bytes:
+    """One slide, one textbox; each paragraph is a list of (text, bold) runs."""
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    tf = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(6), Inches(3)).text_frame
+    for i, runs in enumerate(paragraphs):
+        para = tf.paragraphs[0] if i == 0 else tf.add_paragraph()
+        for text, bold in runs:
+            run = para.add_run()
+            run.text = text
+            run.font.bold = bold
+    out = BytesIO()
+    prs.save(out)
+    return out.getvalue()
+
+def rendered_runs(pptx_bytes: bytes):
+    """[(text, bold) per run] for each paragraph of the first textbox."""
+    shape = Presentation(BytesIO(pptx_bytes)).slides[0].shapes[0]
+    return [[(r.text, r.font.bold) for r in p.runs] for p in shape.text_frame.paragraphs]
+
+class RenderPptxTest(unittest.TestCase):
+    def test_token_split_across_runs(self):
+        deck = make_deck([("Estimado/a {{CANDI", False), ("DATE_NAME}}:", False)])
+        self.assertEqual(rendered_runs(render_pptx(deck, MAPPING)), [[("Estimado/a Ana Pérez:", False)]])
+
+    def test_tokens_within_runs_keep_run_formatting(self):
+        deck = make_deck([("Salario: ", False), ("X.XXX.XXX", True), (" ARS", False)])
+        self.assertEqual(
+            rendered_runs(render_pptx(deck, MAPPING)),
+            [[("Salario: ", False), ("2.000.000", True), (" ARS", False)]],
+        )
+
+    def test_city_tail_line_is_rewritten(self):
+        deck = make_deck(
+            [("XX de XXXXX de 2025, Buenos Aires", None)],
+            [("Oficinas en Buenos Aires", None)],
+        )
+        self.assertEqual(
+            rendered_runs(render_pptx(deck, MAPPING)),
+            [[("14 de febrero de 2026, Córdoba", None)], [("Oficinas en Buenos Aires", None)]],
+        )
+        no_date = {k: v for k, v in MAPPING.items() if k != "DATE"}
+        self.assertEqual(rendered_runs(render_pptx(deck, no_date))[0], [("Córdoba", None)])
+
+    def test_no_op_render_returns_input(self):
+        deck = make_deck([("Bienvenida al equipo", None)])
+        self.assertIs(render_pptx(deck, MAPPING), deck)
+
+    def test_output_zip_keeps_member_order_and_compression(self):
+        src = make_deck([("Hola {{CANDIDATE_NAME}}", None)])
+        # Mix stored and deflated members so compress_type is actually exercised
+        buf = BytesIO()
+        with zipfile.ZipFile(BytesIO(src)) as zin, zipfile.ZipFile(buf, "w") as zout:
+            for i, item in enumerate(zin.infolist()):
+                data = zin.read(item)
+                item.compress_type = zipfile.ZIP_STORED if i % 2 else zipfile.ZIP_DEFLATED
+                zout.writestr(item, data)
+        deck = buf.getvalue()
+
+        out = render_pptx(deck, MAPPING)
+        with zipfile.ZipFile(BytesIO(deck)) as zin, zipfile.ZipFile(BytesIO(out)) as zout:
+            before = [(i.filename, i.compress_type) for i in zin.infolist()]
+            after = [(i.filename, i.compress_type) for i in zout.infolist()]
+        self.assertEqual(after, before)
+        self.assertEqual(rendered_runs(out), [[("Hola Ana Pérez", None)]])
+
+if __name__ == "__main__":
+    unittest.main()